@@ -8,12 +8,21 @@ __email__       = "foss@mniewoehner.de"
 __license__     = 'GPL-2.0-or-later'
 __copyright__   = 'Copyright (c) 2024 Michael Niewöhner'
 
+import os
+import sys
+import errno
 import time
-from functools import partialmethod, wraps
+import struct
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, partialmethod, wraps
+from contextlib import contextmanager, asynccontextmanager
 from enum import IntEnum
-from collections.abc import Iterable
+from collections.abc import Iterable, Sized
+from fcntl import ioctl
 from smbus2 import SMBus, i2c_msg
-from pyhexdump import hexdump
+from smbus2.smbus2 import I2C_RDWR, i2c_rdwr_ioctl_data
 
 R = i2c_msg.read
 W = i2c_msg.write
@@ -34,6 +43,25 @@ class ADDR(IntEnum):
 #    HALT  = 0x80
 #    DEBUGEN = 0x71
 
+def hexdump(data, start_addr=0, addr_len=2):
+    # format the whole buffer with one bytes.hex() call and slice it into
+    # 16-byte rows of 3-char cells, rows start on a 16-byte boundary
+    width = 2 * addr_len + 2
+    pre = start_addr & 0xf
+    cells = "   " * pre + bytes(data).hex(" ") + " "
+    lines = [
+        " " * width + "  ".join(" ".join(f"{i:02x}" for i in range(g, g + 4)) for g in range(0, 16, 4)),
+        " " * width + "  ".join(["-- -- -- --"] * 4),
+    ]
+    addr = start_addr - pre
+    for off in range(0, len(cells) - 1, 48):
+        row = cells[off:off + 48]
+        row = " ".join((row[0:12], row[12:24], row[24:36], row[36:48])).rstrip()
+        lines.append(f"{addr:0{2 * addr_len}x}: {row}")
+        addr += 16
+
+    sys.stdout.write("\n".join(lines) + "\n")
+
 def debug(func, *args, **kwargs):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
@@ -54,27 +82,28 @@ def isp(func, *args, **kwargs):
 
     return wrapper
 
-def limit_addr(_min, _max):
-    def dec_limit_addr(func):
-        @wraps(func)
-        def wrapper(self, addr, len_data=1, *args, **kwargs):
-            if not _min <= addr <= _max:
-                name = func.__name__.split("_")[0].upper()
-                raise(Exception(f"Error: {name} start address invalid. Range is {_min} <= addr <= {_max}"))
-
-            max_addr = addr + (len_data if '_read_' in func.__name__ else len(len_data)) - 1
-            if not _min <= max_addr <= _max:
-                name = func.__name__.split("_")[0].upper()
-                raise(Exception(f"Error: {name} end address invalid. Range is {_min} <= addr <= {_max}"))
-
-            return func(self, addr, len_data, *args, **kwargs)
-        return wrapper
-    return dec_limit_addr
-
 class I2RTD:
-    def __init__(self, bus):
+    def __init__(self, bus, pec=False):
         self.bus = SMBus(bus)
-        self._halted = False
+        # bound once for the hot paths
+        self._xfer = self.bus.i2c_rdwr
+        self._W_dbg = partial(W, ADDR.DBG)
+        self._R_dbg = partial(R, ADDR.DBG)
+        # reused by the per-byte read paths, only the address gets patched
+        self._xdata_msgs = self._xdata_msgs_new()
+        self._eeprom_msgs = (self._W_dbg([0x44, 0x00, 0x00, 0x00, 0x00]), self._R_dbg(1))
+        self._ioctl_rdwr = partial(ioctl, self.bus.fd, I2C_RDWR)
+        # batched [W, R] pairs per I2C_RDWR call, kernel limit is 42 messages
+        self._script_pairs = 21
+        self._script = None
+        # nesting depth of debug_halt_mcu(True) calls
+        self._halt_depth = 0
+        # cached mode state, None means unknown
+        self._isp_enabled = None
+        self._debug_enabled = None
+        # xdata read cache, only addresses in xdata_cacheable are kept
+        self._xdata_cache = {}
+        self.xdata_cacheable = set()
 
         try:
             # ISP should always respond
@@ -84,65 +113,137 @@ class I2RTD:
             raise(Exception("device not reachable"))
             raise(e)
 
+        # PEC is checked by the kernel/adapter for SMBus transfers only, that
+        # is the ISP register accesses; the scaler must support it, otherwise
+        # every ISP access fails. Debug port transfers are not covered.
+        if pec:
+            self.bus.pec = 1
+
+    def close(self):
+        self.bus.close()
+
+    @staticmethod
+    def _check(name, addr, _len, _min, _max):
+        if not _min <= addr <= _max:
+            raise(Exception(f"Error: {name} start address invalid. Range is {_min} <= addr <= {_max}"))
+
+        if not _min <= addr + _len - 1 <= _max:
+            raise(Exception(f"Error: {name} end address invalid. Range is {_min} <= addr <= {_max}"))
+
+    def _iter_read(self, read, addr, _len, burst=False, page=0x100, read_seq=None):
+        # burst=True is only correct for ranges whose read pointer
+        # auto-increments; that is up to the caller, as register ranges
+        # usually don't
+        end = addr + _len
+        while addr < end:
+            # never burst across a page, the pointer may wrap there
+            n = min(end, (addr // page + 1) * page) - addr
+            if burst:
+                data = read(addr, n)
+            elif read_seq:
+                data = read_seq(addr, n)
+            else:
+                data = b"".join(read(_addr, 1) for _addr in range(addr, addr + n))
+
+            yield data
+            addr += n
+
+    def _dump(self, read_func, addr, _len, end, *args, **kwargs):
+        if end:
+            _len = end - addr + 1
+
+        hexdump(read_func(addr, _len, *args, **kwargs), start_addr=addr, addr_len=read_func._addr_len)
+
+    def invalidate_state(self):
+        # call after ISP/debug mode was changed behind our back
+        self._isp_enabled = None
+        self._debug_enabled = None
+        self._halt_depth = 0
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        self._xdata_cache.clear()
+
     def isp_enable(self, onoff, force=False):
         if self.isp_enabled == onoff and not force:
             return
 
         if onoff:
-            self.bus.transfer(W(ADDR.ISP, [0x6f, 0x80]))
+            self.bus.write_byte_data(ADDR.ISP, 0x6f, 0x80)
         else:
-            self.bus.transfer(W(ADDR.ISP, [0x6f, 0x00]))
+            self.bus.write_byte_data(ADDR.ISP, 0x6f, 0x00)
+            # leaving ISP resets the scaler, the MCU runs again
+            self._debug_enabled = None
+            self._halt_depth = 0
+            self.invalidate_cache()
+
+        # an ACKed write doesn't mean the mode changed, probe on next use
+        self._isp_enabled = None
 
     @property
     def isp_enabled(self):
-        m = R(ADDR.ISP, 1)
-        self.bus.transfer(W(ADDR.ISP, [0x6f]), m)
-        return bool(int.from_bytes(m) & 0x80)
+        if self._isp_enabled is None:
+            self._isp_enabled = bool(self.bus.read_byte_data(ADDR.ISP, 0x6f) & 0x80)
+
+        return self._isp_enabled
+
+    def _isp_read_xfr(self, addr, _len):
+        # plain register accesses, use the SMBus calls
+        if _len == 1:
+            return bytes((self.bus.read_byte_data(ADDR.ISP, addr),))
+
+        return bytes(self.bus.read_i2c_block_data(ADDR.ISP, addr, _len))
 
     @isp
-    @limit_addr(0x00, 0xff)
-    def isp_iter_read_xfr(self, addr, _len=1):
-        for _addr in range(addr, addr + _len):
-            m = R(ADDR.ISP, 1)
-            self.bus.transfer(W(ADDR.ISP, [_addr]))
-            self.bus.transfer(m)
-            yield int.from_bytes(m)
-
-    def isp_read_xfr(self, addr, _len=1):
-        return list(self.debug_iter_read_xfr(addr, _len))
-
-    def isp_dump_xfr(self, addr, _len=1, end=0):
-        if end:
-            _len = end - addr + 1
+    def _isp_chunks_xfr(self, addr, _len, burst):
+        self._check("ISP", addr, _len, 0x00, 0xff)
+        # SMBus block reads are limited to 32 bytes
+        yield from self._iter_read(self._isp_read_xfr, addr, _len, burst, page=32)
 
-        hexdump(self.debug_iter_read_xfr(addr, _len, halt), start_addr=addr, addr_len=1)
+    def isp_iter_read_xfr(self, addr, _len=1, burst=False):
+        for chunk in self._isp_chunks_xfr(addr, _len, burst):
+            yield from chunk
+
+    def isp_read_xfr(self, addr, _len=1, burst=False):
+        return b"".join(self._isp_chunks_xfr(addr, _len, burst))
+
+    isp_read_xfr._addr_len = 1
+
+    def isp_dump_xfr(self, addr, _len=1, end=0, burst=False):
+        self._dump(self.isp_read_xfr, addr, _len, end, burst=burst)
 
     @isp
-    @limit_addr(0x00, 0xff)
     def isp_write_xfr(self, addr, data):
         if not isinstance(data, Iterable): raise(Exception("data must be iterable"))
+        if not isinstance(data, Sized): data = list(data)
+        self._check("ISP", addr, len(data), 0x00, 0xff)
 
         for _addr, val in enumerate(data, addr):
-            self.bus.transfer(W(ADDR.ISP, [_addr, val]))
+            self.bus.write_byte_data(ADDR.ISP, _addr, val)
 
     def isp_reset(self):
         self.isp_enable(True, force=True)
         # reset mcu and scalar
-        self.bus.transfer(W(ADDR.ISP, [0xee, 0x03]))
+        self.bus.write_byte_data(ADDR.ISP, 0xee, 0x03)
+        self.invalidate_state()
 
     @property
     def debug_enabled(self):
-        try:
-            self.bus.read_byte(ADDR.DBG)
-            return True
-        except OSError:
-            return False
+        if self._debug_enabled is None:
+            try:
+                # plain I2C read, so an enabled PEC can't fail the probe
+                self._xfer(self._R_dbg(1))
+                self._debug_enabled = True
+            except OSError:
+                self._debug_enabled = False
+
+        return self._debug_enabled
 
     def debug_enable(self, onoff, force=False):
         if self.debug_enabled == onoff and not force:
             return
 
-        if not onoff and self._halted:
+        if not onoff and self._halt_depth:
             raise(Exception("Debug must not be disabled when MCU is halted!"))
 
         time.sleep(0.05)
@@ -156,100 +257,323 @@ class I2RTD:
             #self.bus.transfer(W(ADDR.DBG, [VCP.DEBUGEN, 0x00]))
             self.bus.transfer(W(ADDR.DBG, [0x71, 0x00]))
 
+        self._debug_enabled = None
         time.sleep(0.05)
 
     @debug
     def debug_halt_mcu(self, halt):
+        # halts nest, only the outermost halt/resume reaches the MCU
+        if halt and self._halt_depth:
+            self._halt_depth += 1
+            return
+
+        if not halt and self._halt_depth > 1:
+            self._halt_depth -= 1
+            return
+
         time.sleep(0.1)
         self.bus.transfer(W(ADDR.DBG, [0x80, int(halt)]))
-        self._halted = halt
+        self._halt_depth = int(halt)
+        self.invalidate_cache()
         time.sleep(0.1)
 
-    @debug
-    @limit_addr(0x0000, 0xffff)
-    def debug_iter_read_xdata(self, addr, _len=1, end=0, halt=True):
-        if halt:
-            self.debug_halt_mcu(True)
+    @contextmanager
+    def halted(self):
+        # keep the MCU halted across several calls
+        self.debug_halt_mcu(True)
+        try:
+            yield self
+        finally:
+            self.debug_halt_mcu(False)
 
-        for _addr in range(addr, addr + _len):
-            m = R(ADDR.DBG, 1)
-            addrH, addrL = _addr >> 8 & 0xff, _addr & 0xff
-            self.bus.transfer(W(ADDR.DBG, [0x3a, addrL, addrH]))
-            if not halt:
-                time.sleep(0.01)
-            self.bus.transfer(m)
-            yield int.from_bytes(m)
+    def _debug_read_xdata(self, addr, _len, halt):
+        addrH, addrL = addr >> 8 & 0xff, addr & 0xff
+        if _len == 1:
+            w, m = self._xdata_msgs
+            w.buf[1], w.buf[2] = addrL, addrH
+        else:
+            w, m = self._W_dbg([0x3a, addrL, addrH]), self._R_dbg(_len)
 
         if halt:
-            self.debug_halt_mcu(False)
+            # halted MCU answers immediately, use a repeated start
+            self._xfer(w, m)
+        else:
+            self._xfer(w)
+            time.sleep(0.01)
+            self._xfer(m)
+        return bytes(m)
+
+    def _xdata_msgs_new(self):
+        return self._W_dbg([0x3a, 0x00, 0x00]), self._R_dbg(1)
+
+    def _debug_read_xdata_seq(self, addr, _len):
+        # halted MCU only: send a whole script of [W, R] pairs per ioctl
+        data = bytearray()
+        end = addr + _len
+        while addr < end:
+            if not self._script_pairs:
+                # not even a single pair per transfer is accepted, write the
+                # pointer and read the byte back in separate transfers
+                w, m = self._xdata_msgs
+                for _addr in range(addr, end):
+                    w.buf[1], w.buf[2] = _addr & 0xff, _addr >> 8 & 0xff
+                    self._xfer(w)
+                    self._xfer(m)
+                    data += m.buf[0]
+                break
+
+            if self._script is None:
+                msgs = [msg for _ in range(self._script_pairs) for msg in self._xdata_msgs_new()]
+                self._script = (msgs, i2c_rdwr_ioctl_data.create(*msgs))
+
+            msgs, rdwr = self._script
+            n = min(end - addr, len(msgs) // 2)
+            for w, _addr in zip(msgs[0::2], range(addr, addr + n)):
+                w.buf[1], w.buf[2] = _addr & 0xff, _addr >> 8 & 0xff
+
+            rdwr.nmsgs = 2 * n
+            try:
+                self._ioctl_rdwr(rdwr)
+            except OSError as e:
+                # adapter allows fewer messages per transfer (EINVAL) or caps
+                # them / refuses combined transfers (EOPNOTSUPP), halve and retry
+                if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                self._script_pairs = n // 2
+                self._script = None
+                continue
+
+            data += b"".join(m.buf[0] for m in msgs[1:2 * n:2])
+            addr += n
+
+        return bytes(data)
+
+    @debug
+    def _debug_chunks_xdata(self, addr, _len, halt, burst):
+        self._check("DEBUG", addr, _len, 0x0000, 0xffff)
 
-    def debug_read_xdata(self, addr, _len=1, halt=True):
-        return list(self.debug_iter_read_xdata(addr, _len, halt))
+        if halt:
+            self.debug_halt_mcu(True)
+        halted = self._halt_depth > 0
 
-    def debug_dump_xdata(self, addr, _len=1, end=0, halt=True):
+        try:
+            read = partial(self._debug_read_xdata, halt=halted)
+            read_seq = self._debug_read_xdata_seq if halted else None
+            yield from self._iter_read(read, addr, _len, burst, read_seq=read_seq)
+        finally:
+            if halt:
+                self.debug_halt_mcu(False)
+
+    def debug_iter_read_xdata(self, addr, _len=1, end=0, halt=True, burst=False):
         if end:
             _len = end - addr + 1
 
-        hexdump(self.debug_iter_read_xdata(addr, _len, halt=halt), start_addr=addr, addr_len=2)
+        for chunk in self._debug_chunks_xdata(addr, _len, halt, burst):
+            yield from chunk
+
+    def debug_read_xdata(self, addr, _len=1, halt=True, use_cache=False, burst=False):
+        if not use_cache:
+            return b"".join(self._debug_chunks_xdata(addr, _len, halt, burst))
+
+        cache = self._xdata_cache
+        addrs = range(addr, addr + _len)
+        if all(_addr in cache for _addr in addrs):
+            return bytes(cache[_addr] for _addr in addrs)
+
+        data = b"".join(self._debug_chunks_xdata(addr, _len, halt, burst))
+        for _addr, val in zip(addrs, data):
+            if _addr in self.xdata_cacheable:
+                cache[_addr] = val
+
+        return data
+
+    debug_read_xdata._addr_len = 2
+
+    def debug_dump_xdata(self, addr, _len=1, end=0, halt=True, burst=False):
+        self._dump(self.debug_read_xdata, addr, _len, end, halt=halt, burst=burst)
 
     @debug
-    @limit_addr(0x0000, 0xffff)
     def debug_write_xdata(self, addr, data, halt=True):
         if not isinstance(data, Iterable): raise(Exception("data must be iterable"))
+        if not isinstance(data, Sized): data = list(data)
+        self._check("DEBUG", addr, len(data), 0x0000, 0xffff)
 
         if halt:
             self.debug_halt_mcu(True)
+        halted = self._halt_depth > 0
 
-        for _addr, val in enumerate(data, addr):
-            addrH, addrL = _addr >> 8 & 0xff, _addr & 0xff
-            self.bus.transfer(W(ADDR.DBG, [0x3b, addrL, addrH, val]))
-            if not halt:
-                time.sleep(0.01)
+        try:
+            # build all [0x3b, addrL, addrH, val] records at once
+            n = len(data)
+            addrs = struct.pack(f"<{n}H", *range(addr, addr + n))
+            recs = bytearray(4 * n)
+            recs[0::4] = b"\x3b" * n
+            recs[1::4] = addrs[0::2]
+            recs[2::4] = addrs[1::2]
+            recs[3::4] = bytes(data)
+
+            for _addr in range(addr, addr + n):
+                self._xdata_cache.pop(_addr, None)
+
+            recs = memoryview(recs)
+            for off in range(0, 4 * n, 4):
+                self._xfer(self._W_dbg(recs[off:off + 4]))
+                if not halted:
+                    time.sleep(0.01)
+        finally:
+            if halt:
+                self.debug_halt_mcu(False)
+
+    def _debug_read_eeprom(self, addr, _len, i2caddr, halt):
+        addrH, addrL = addr >> 8 & 0xff, addr & 0xff
+        if _len == 1:
+            w, m = self._eeprom_msgs
+            w.buf[1], w.buf[2], w.buf[4] = addrL, i2caddr, addrH
+        else:
+            w, m = self._W_dbg([0x44, addrL, i2caddr, 0x00, addrH]), self._R_dbg(_len)
 
-        if halt:
-            self.debug_halt_mcu(False)
+        self._xfer(w)
+        time.sleep(0.01 if halt else 0.02)
+        self._xfer(m)
+        return bytes(m)
 
     @debug
-    def debug_iter_read_eeprom(self, addr, _len=1, i2caddr=0xa0, halt=True):
+    def _debug_chunks_eeprom(self, addr, _len, i2caddr, halt, burst):
         if halt:
             self.debug_halt_mcu(True)
+        halted = self._halt_depth > 0
 
-        for _addr in range(addr, addr + _len):
-            addrH, addrL = _addr >> 8 & 0xff, _addr & 0xff
-            m = R(ADDR.DBG, 1)
-            self.bus.transfer(W(ADDR.DBG, [0x44, addrL, i2caddr, 0x00, addrH]))
-            time.sleep(0.01)
-            if not halt:
-                time.sleep(0.01)
-            self.bus.transfer(m)
-            yield int.from_bytes(m)
+        try:
+            # burst=True assumes the debug port returns consecutive EEPROM
+            # bytes after 0x44; not verified on hardware
+            read = partial(self._debug_read_eeprom, i2caddr=i2caddr, halt=halted)
+            yield from self._iter_read(read, addr, _len, burst)
+        finally:
+            if halt:
+                self.debug_halt_mcu(False)
 
-        if halt:
-            self.debug_halt_mcu(False)
+    def debug_iter_read_eeprom(self, addr, _len=1, i2caddr=0xa0, halt=True, burst=False):
+        for chunk in self._debug_chunks_eeprom(addr, _len, i2caddr, halt, burst):
+            yield from chunk
 
-    def debug_read_eeprom(self, addr, _len=1, halt=True):
-        return list(self.debug_iter_read_eeprom(addr, _len, halt=halt))
+    def debug_read_eeprom(self, addr, _len=1, halt=True, burst=False, i2caddr=0xa0):
+        return b"".join(self._debug_chunks_eeprom(addr, _len, i2caddr, halt, burst))
 
-    def debug_dump_eeprom(self, addr, _len=1, end=0, halt=True):
-        if end:
-            _len = end - addr + 1
+    debug_read_eeprom._addr_len = 2
 
-        hexdump(self.debug_iter_read_eeprom(addr, _len, halt=halt), start_addr=addr, addr_len=4)
+    def debug_dump_eeprom(self, addr, _len=1, end=0, halt=True, burst=False, i2caddr=0xa0):
+        self._dump(self.debug_read_eeprom, addr, _len, end, halt=halt, burst=burst, i2caddr=i2caddr)
 
     @debug
-    def debug_write_eeprom(self, addr, data, i2caddr=0xa0, halt=True):
+    def debug_write_eeprom(self, addr, data, i2caddr=0xa0, halt=True, page_size=1):
         if not isinstance(data, Iterable): raise(Exception("data must be iterable"))
+        if page_size < 1 or page_size & (page_size - 1):
+            raise(Exception("page_size must be a power of two"))
 
         if halt:
             self.debug_halt_mcu(True)
+        halted = self._halt_depth > 0
 
-        for _addr, val in enumerate(data, addr):
-            addrH, addrL = _addr >> 8 & 0xff, _addr & 0xff
-            self.bus.transfer(W(ADDR.DBG, [0x04, addrL, i2caddr, val, addrH]))
-            time.sleep(0.01)
-            if not halt:
-                time.sleep(0.01)
-
-        if halt:
-            self.debug_halt_mcu(False)
-
+        try:
+            # page_size > 1 sends one page write per EEPROM page; the payload
+            # sits between i2caddr and addrH, just like the single byte
+            data = list(data)
+            off = 0
+            while off < len(data):
+                _addr = addr + off
+                n = min(len(data) - off, page_size - _addr % page_size)
+                addrH, addrL = _addr >> 8 & 0xff, _addr & 0xff
+                self._xfer(self._W_dbg([0x04, addrL, i2caddr, *data[off:off + n], addrH]))
+                # the scaler clocks the page out to the EEPROM (~0.1 ms per
+                # byte at 100 kHz) before the EEPROM's write cycle starts
+                time.sleep((0.01 if halted else 0.02) + (n - 1) * 1e-4)
+                off += n
+        finally:
+            if halt:
+                self.debug_halt_mcu(False)
+
+def _bus_shared(name):
+    # attribute kept in the per-bus state of AsyncI2RTD; I2RTD.__init__ sets
+    # it before the state is attached, that must not clobber other instances
+    def fget(self):
+        return self._bus_state[name]
+
+    def fset(self, value):
+        state = vars(self).get('_bus_state')
+        if state is not None:
+            state[name] = value
+
+    return property(fget, fset)
+
+class AsyncI2RTD(I2RTD):
+    # All instances on one bus talk to the same scaler (the slave addresses
+    # are fixed), so they share a lock held for each whole operation, the
+    # MCU halt depth, the mode state and the xdata cache.
+    _bus_states = {}
+    _bus_states_lock = threading.Lock()
+
+    _halt_depth    = _bus_shared('_halt_depth')
+    _isp_enabled   = _bus_shared('_isp_enabled')
+    _debug_enabled = _bus_shared('_debug_enabled')
+    _xdata_cache   = _bus_shared('_xdata_cache')
+
+    def __init__(self, bus, pec=False):
+        super().__init__(bus, pec)
+        # one worker thread per instance, instances on different buses run
+        # in parallel
+        self._exec = ThreadPoolExecutor(max_workers=1)
+
+        # 11 and '/dev/i2c-11' are the same bus
+        path = os.path.realpath(bus if isinstance(bus, str) else f"/dev/i2c-{bus}")
+        with self._bus_states_lock:
+            self._bus_state = self._bus_states.setdefault(path, {
+                'lock': threading.Lock(),
+                '_halt_depth': 0,
+                '_isp_enabled': None,
+                '_debug_enabled': None,
+                '_xdata_cache': {},
+            })
+
+    def _locked(self, func, *args, **kwargs):
+        with self._bus_state['lock']:
+            return func(self, *args, **kwargs)
+
+    def close(self):
+        # let queued calls finish before the bus goes away
+        self._exec.shutdown(wait=True)
+        super().close()
+
+    async def aclose(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._exec, partial(self._locked, func, *args, **kwargs))
+
+    aisp_enable         = partialmethod(_run, I2RTD.isp_enable)
+    aisp_read_xfr       = partialmethod(_run, I2RTD.isp_read_xfr)
+    aisp_dump_xfr       = partialmethod(_run, I2RTD.isp_dump_xfr)
+    aisp_write_xfr      = partialmethod(_run, I2RTD.isp_write_xfr)
+    aisp_reset          = partialmethod(_run, I2RTD.isp_reset)
+    adebug_enable       = partialmethod(_run, I2RTD.debug_enable)
+    adebug_halt_mcu     = partialmethod(_run, I2RTD.debug_halt_mcu)
+    adebug_read_xdata   = partialmethod(_run, I2RTD.debug_read_xdata)
+    adebug_dump_xdata   = partialmethod(_run, I2RTD.debug_dump_xdata)
+    adebug_write_xdata  = partialmethod(_run, I2RTD.debug_write_xdata)
+    adebug_read_eeprom  = partialmethod(_run, I2RTD.debug_read_eeprom)
+    adebug_dump_eeprom  = partialmethod(_run, I2RTD.debug_dump_eeprom)
+    adebug_write_eeprom = partialmethod(_run, I2RTD.debug_write_eeprom)
+
+    @asynccontextmanager
+    async def ahalted(self):
+        await self.adebug_halt_mcu(True)
+        try:
+            yield self
+        finally:
+            await self.adebug_halt_mcu(False)